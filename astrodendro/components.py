@@ -4,17 +4,20 @@ import numpy as np
 
 class Leaf(object):
 
-    def __init__(self, x, y, z, f, id=None):
-        self.x = np.array([x], dtype=int)
-        self.y = np.array([y], dtype=int)
-        self.z = np.array([z], dtype=int)
-        self.f = np.array([f], dtype=float)
-        self.xmin, self.xmax = x, x
-        self.ymin, self.ymax = y, y
-        self.zmin, self.zmax = z, z
-        self.fmin, self.fmax = f, f
+    def __init__(self, x=None, y=None, z=None, f=None, id=None):
+        "Create leaf, optionally with an initial point"
+        self.x = np.zeros(0, dtype=int)
+        self.y = np.zeros(0, dtype=int)
+        self.z = np.zeros(0, dtype=int)
+        self.f = np.zeros(0, dtype=float)
+        self.xmin, self.xmax = None, None
+        self.ymin, self.ymax = None, None
+        self.zmin, self.zmax = None, None
+        self.fmin, self.fmax = None, None
         self.id = id
         self.parent = None
+        if x is not None:
+            self.add_point(x, y, z, f)
 
     def __getattr__(self, attribute):
         if attribute == 'npix':
@@ -24,6 +27,11 @@ class Leaf(object):
 
     def add_point(self, x, y, z, f):
         "Add point to current leaf"
+        if len(self.x) == 0:
+            self.xmin, self.xmax = x, x
+            self.ymin, self.ymax = y, y
+            self.zmin, self.zmax = z, z
+            self.fmin, self.fmax = f, f
         self.x = np.hstack([self.x, x])
         self.y = np.hstack([self.y, y])
         self.z = np.hstack([self.z, z])
@@ -49,7 +57,7 @@ class Leaf(object):
         return image
 
     def plot_dendrogram(self, ax, base_level, lines):
-        line = [(self.id, np.max(self.f)), (self.id, base_level)]
+        line = [(self.id, self.fmax), (self.id, base_level)]
         lines.append(line)
         return lines
 
@@ -61,16 +69,21 @@ class Leaf(object):
         return "%i:%.3f" % (self.id, self.fmax - self.fmin)
 
     def get_peak(self):
+        "Return the peak pixel, or None if the leaf has no pixels"
+        if len(self.f) == 0:
+            return None
         imax = np.argmax(self.f)
         return self.x[imax], self.y[imax], self.z[imax], self.f[imax]
 
 
 class Branch(Leaf):
 
-    def __init__(self, items, x, y, z, f, id=None):
+    def __init__(self, items, x=None, y=None, z=None, f=None, id=None):
         self.items = items
         for item in items:
             item.parent = self
+        # IDs of sub-structures not included in items (when reading a region)
+        self.excluded_ids = []
         Leaf.__init__(self, x, y, z, f, id=id)
 
     def __getattr__(self, attribute):
@@ -89,14 +102,15 @@ class Branch(Leaf):
         return Leaf.add_footprint(self, image, level)
 
     def plot_dendrogram(self, ax, base_level, lines):
-        line = [(self.id, np.min(self.f)), (self.id, base_level)]
+        line = [(self.id, self.fmin), (self.id, base_level)]
         lines.append(line)
         items_ids = [item.id for item in self.items]
-        line = [(np.min(items_ids), np.min(self.f)), \
-                (np.max(items_ids), np.min(self.f))]
-        lines.append(line)
+        if len(items_ids) > 0:
+            line = [(np.min(items_ids), self.fmin), \
+                    (np.max(items_ids), self.fmin)]
+            lines.append(line)
         for item in self.items:
-            lines = item.plot_dendrogram(ax, np.min(self.f), lines)
+            lines = item.plot_dendrogram(ax, self.fmin, lines)
         return lines
 
     def set_id(self, start):
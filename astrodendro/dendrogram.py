@@ -27,7 +27,9 @@ import numpy as np
 
 from astrodendro.components import Trunk, Branch, Leaf
 from astrodendro.meshgrid import meshgrid_nd
+from astrodendro.matching import ancestry, overlap_matrix, structure_npix
 from astrodendro.newick import parse_newick
+from astrodendro.sorting import argsort_descending
 
 
 class Dendrogram(object):
@@ -80,8 +82,8 @@ class Dendrogram(object):
         if verbose:
             print "Number of points above minimum: %i" % np.sum(keep)
 
-        # Sort by decreasing flux
-        order = np.argsort(flux)[::-1]
+        # Sort by decreasing flux (ties broken by increasing position)
+        order = argsort_descending(flux)
         flux, X, Y, Z = flux[order], X[order], Y[order], Z[order]
 
         # Define index array indicating what item each cell is part of
@@ -332,34 +334,127 @@ class Dendrogram(object):
     def to_newick(self):
         return self.trunk.to_newick()
 
-    def to_hdf5(self, filename):
+    def match(self, other):
+        '''
+        Match the structures (leaves and branches) in this dendrogram with
+        those in another dendrogram computed on the same grid.
+
+        Structures are compared by pixel overlap, where branches include the
+        pixels of all their sub-structures. For each structure that overlaps
+        with the other dendrogram, the best match is the structure with the
+        largest overlap fraction, defined as the number of shared pixels
+        divided by the number of pixels in the union of the two structures.
+
+        Returns a dictionary mapping the ID of each structure to a tuple
+        (ID of best match in other, overlap fraction).
+        '''
+
+        ancestry1 = ancestry(self.trunk)
+        ancestry2 = ancestry(other.trunk)
+
+        id1, id2, overlap = overlap_matrix(self.index_map, ancestry1,
+                                           other.index_map, ancestry2)
+
+        ids, npix = structure_npix(self.index_map, ancestry1)
+        npix1 = npix[np.searchsorted(ids, id1)]
+
+        ids, npix = structure_npix(other.index_map, ancestry2)
+        npix2 = npix[np.searchsorted(ids, id2)]
+
+        fraction = overlap / (npix1 + npix2 - overlap).astype(float)
+
+        # Find the best match for each structure (ties go to the lowest ID)
+        order = np.lexsort((-fraction, id1))
+        id1, id2, fraction = id1[order], id2[order], fraction[order]
+        best = np.hstack([True, id1[1:] != id1[:-1]])[:len(id1)]
+
+        matches = {}
+        for i, j, f in zip(id1[best], id2[best], fraction[best]):
+            matches[int(i)] = (int(j), float(f))
+
+        return matches
+
+    def to_hdf5(self, filename, chunks=None, compression='gzip'):
+        '''
+        Write the dendrogram to an HDF5 file.
+
+        The data, index_map, and item_type_map datasets are stored with
+        spatial chunking, so that sub-regions can later be read without
+        loading the whole file (see from_hdf5). By default, chunks of
+        32x32x32 pixels (3D) or 128x128 pixels (2D) are used - a different
+        chunk shape can be specified with chunks. The compression argument
+        is passed to h5py, and can be e.g. 'gzip', 'lzf' (faster, but less
+        efficient), or None.
+        '''
 
         import h5py
 
+        if chunks is None:
+            if self.n_dim == 2:
+                chunks = (128, 128)
+            else:
+                chunks = (32, 32, 32)
+
+        if len(chunks) != self.n_dim:
+            raise Exception("chunks should have %i dimensions" % self.n_dim)
+
+        # Chunks cannot be larger than the dataset
+        chunks = tuple([min(c, n) for c, n in zip(chunks, self.data.shape)])
+
         f = h5py.File(filename, 'w')
 
         f.attrs['n_dim'] = self.n_dim
 
         f.create_dataset('newick', data=self.to_newick())
 
-        d = f.create_dataset('index_map', data=self.index_map, compression=True)
+        # Store the flux range of all structures, which is needed when
+        # reading in only a region of the file
+        levels = []
+
+        def collect_levels(items):
+            for item in items:
+                levels.append((item.id, item.fmin, item.fmax))
+                if type(item) == Branch:
+                    collect_levels(item.items)
+
+        collect_levels(self.trunk)
+
+        f.create_dataset('levels', data=np.array(levels, dtype=float))
+
+        d = f.create_dataset('index_map', data=self.index_map, chunks=chunks, compression=compression)
         d.attrs['CLASS'] = 'IMAGE'
         d.attrs['IMAGE_VERSION'] = '1.2'
         d.attrs['IMAGE_MINMAXRANGE'] = [self.index_map.min(), self.index_map.max()]
 
-        d = f.create_dataset('item_type_map', data=self.item_type_map, compression=True)
+        d = f.create_dataset('item_type_map', data=self.item_type_map, chunks=chunks, compression=compression)
         d.attrs['CLASS'] = 'IMAGE'
         d.attrs['IMAGE_VERSION'] = '1.2'
         d.attrs['IMAGE_MINMAXRANGE'] = [self.item_type_map.min(), self.item_type_map.max()]
 
-        d = f.create_dataset('data', data=self.data, compression=True)
+        d = f.create_dataset('data', data=self.data, chunks=chunks, compression=compression)
         d.attrs['CLASS'] = 'IMAGE'
         d.attrs['IMAGE_VERSION'] = '1.2'
         d.attrs['IMAGE_MINMAXRANGE'] = [self.data.min(), self.data.max()]
 
         f.close()
 
-    def from_hdf5(self, filename):
+    def from_hdf5(self, filename, region=None):
+        '''
+        Read a dendrogram from an HDF5 file written by to_hdf5.
+
+        If region is specified, it should be a tuple of slices (one per
+        dimension of the original data, e.g. (slice(10, 50), slice(0, 20))
+        for 2D data), and only the chunks covering this sub-region are read
+        from the file. In this case, data, index_map and item_type_map are
+        the cutouts, the structures only contain the pixels inside the
+        region (with coordinates still relative to the full dataset), and
+        only structures that intersect the region (either directly or
+        through their sub-structures) are kept, along with their position in
+        the tree. The IDs of the sub-structures of a branch that do not
+        intersect the region are listed in its excluded_ids attribute. The
+        flux range (fmin and fmax) of each structure is always that of the
+        full structure, as stored in the file.
+        '''
 
         import h5py
 
@@ -367,45 +462,93 @@ class Dendrogram(object):
 
         self.n_dim = f.attrs['n_dim']
 
+        if region is None:
+            region = tuple([slice(None)] * self.n_dim)
+        elif len(region) != self.n_dim:
+            raise Exception("region should have %i dimensions" % self.n_dim)
+        elif not all([type(s) == slice for s in region]):
+            raise Exception("region should be a tuple of slices")
+        elif 'levels' not in f:
+            raise Exception("file was written by an older version of to_hdf5, and cannot be read in by region")
+
+        # Find offset of region in the full dataset
+        offset = []
+        for s, n in zip(region, f['data'].shape):
+            start, stop, step = s.indices(n)
+            if step != 1:
+                raise Exception("region slices should have a step of 1")
+            offset.append(start)
+
+        # Read in the region (this only reads the chunks that are needed)
+        self.data = f['data'][region]
+        self.index_map = f['index_map'][region]
+        self.item_type_map = f['item_type_map'][region]
+
         # If array is 2D, reshape to 3D
         if self.n_dim == 2:
-            self.data = f['data'].value.reshape(1, f['data'].shape[0], f['data'].shape[1])
-            self.index_map = f['index_map'].value.reshape(1, f['data'].shape[0], f['data'].shape[1])
-            self.item_type_map = f['item_type_map'].value.reshape(1, f['data'].shape[0], f['data'].shape[1])
-        else:
-            self.data = f['data'].value
-            self.index_map = f['index_map'].value
-            self.item_type_map = f['item_type_map'].value
+            self.data = self.data.reshape(1, self.data.shape[0], self.data.shape[1])
+            self.index_map = self.index_map.reshape(1, self.data.shape[1], self.data.shape[2])
+            self.item_type_map = self.item_type_map.reshape(1, self.data.shape[1], self.data.shape[2])
+            offset = [0] + offset
 
         # Extract data shape
         nz, ny, nx = self.data.shape
 
         # Create arrays with pixel positions
-        x = np.arange(self.data.shape[2], dtype=np.int32)
-        y = np.arange(self.data.shape[1], dtype=np.int32)
-        z = np.arange(self.data.shape[0], dtype=np.int32)
+        x = np.arange(self.data.shape[2], dtype=np.int32) + offset[2]
+        y = np.arange(self.data.shape[1], dtype=np.int32) + offset[1]
+        z = np.arange(self.data.shape[0], dtype=np.int32) + offset[0]
         X, Y, Z = meshgrid_nd(x, y, z)
 
         tree = parse_newick(f['newick'].value)
 
+        # Read in the flux range of all structures
+        levels = {}
+        if 'levels' in f:
+            for idx, fmin, fmax in f['levels'].value:
+                levels[int(idx)] = (fmin, fmax)
+
+        f.close()
+
+        # Find which structures have pixels in the region
+        present = set(np.unique(self.index_map).tolist())
+
+        # Find which structures intersect the region, either directly or
+        # through their sub-structures
+        intersecting = set()
+
+        def find_intersecting(d):
+            found = False
+            for idx in d:
+                if type(d[idx]) == tuple and find_intersecting(d[idx][0]):
+                    intersecting.add(idx)
+                elif idx in present:
+                    intersecting.add(idx)
+                found = found or idx in intersecting
+            return found
+
+        find_intersecting(tree)
+
         def construct_tree(d):
             items = []
             for idx in d:
-                x = X[self.index_map == idx]
-                y = Y[self.index_map == idx]
-                z = Z[self.index_map == idx]
-                f = self.data[self.index_map == idx]
+                if idx not in intersecting:
+                    continue
                 if type(d[idx]) == tuple:
-                    sub_items = construct_tree(d[idx][0])
-                    b = Branch(sub_items, x[0], y[0], z[0], f[0], id=idx)
-                    for i in range(1, len(x)):
-                        b.add_point(x[i], y[i], z[i], f[i])
-                    items.append(b)
+                    item = Branch(construct_tree(d[idx][0]), id=idx)
+                    item.excluded_ids = [i for i in d[idx][0] if i not in intersecting]
                 else:
-                    l = Leaf(x[0], y[0], z[0], f[0], id=idx)
-                    for i in range(1, len(x)):
-                        l.add_point(x[i], y[i], z[i], f[i])
-                    items.append(l)
+                    item = Leaf(id=idx)
+                if idx in present:
+                    x = X[self.index_map == idx]
+                    y = Y[self.index_map == idx]
+                    z = Z[self.index_map == idx]
+                    f = self.data[self.index_map == idx]
+                    for i in range(len(x)):
+                        item.add_point(x[i], y[i], z[i], f[i])
+                if idx in levels:
+                    item.fmin, item.fmax = levels[idx]
+                items.append(item)
             return items
 
         self.trunk = Trunk()
@@ -0,0 +1,114 @@
+import numpy as np
+
+from astrodendro.components import Branch
+
+
+def ancestry(trunk):
+    '''
+    Return two arrays (label, ancestor) which together list, for every
+    structure in the tree, the structure itself and each of its ancestors.
+    '''
+
+    labels, ancestors = [], []
+
+    def walk(item, parents):
+        chain = parents + [item.id]
+        for a in chain:
+            labels.append(item.id)
+            ancestors.append(a)
+        if type(item) == Branch:
+            for sub_item in item.items:
+                walk(sub_item, chain)
+
+    for item in trunk:
+        walk(item, [])
+
+    labels = np.array(labels, dtype=np.int64)
+    ancestors = np.array(ancestors, dtype=np.int64)
+
+    order = np.argsort(labels, kind='mergesort')
+
+    return labels[order], ancestors[order]
+
+
+def _expand(labels, ancestry):
+    '''
+    Repeat each element of labels once per ancestor (including itself), and
+    return the index of the original element and the ancestor label for each
+    repeat. Labels that are not part of the tree are dropped.
+    '''
+
+    tree_labels, tree_ancestors = ancestry
+
+    start = np.searchsorted(tree_labels, labels, side='left')
+    stop = np.searchsorted(tree_labels, labels, side='right')
+    n = stop - start
+
+    rows = np.repeat(np.arange(len(labels)), n)
+    offset = np.arange(np.sum(n)) - np.repeat(np.cumsum(n) - n, n)
+
+    return rows, tree_ancestors[np.repeat(start, n) + offset]
+
+
+def _sum_pairs(a, b, weights=None):
+    '''
+    Find the unique (a, b) pairs, and sum the weights for each pair (or
+    count occurrences if weights is not specified).
+    '''
+
+    if len(a) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), \
+               np.zeros(0, dtype=np.int64)
+
+    a = a.astype(np.int64)
+    b = b.astype(np.int64)
+
+    base = b.max() + 1
+    keys, inverse = np.unique(a * base + b, return_inverse=True)
+    counts = np.bincount(inverse.ravel(), weights=weights)
+
+    return keys // base, keys % base, counts.astype(np.int64)
+
+
+def structure_npix(index_map, ancestry):
+    '''
+    Return the IDs of all structures in the tree and their total number of
+    pixels (including sub-structures for branches), computed from index_map.
+    '''
+
+    labels = index_map.ravel()
+    labels, counts = np.unique(labels[labels > 0], return_inverse=True)
+    counts = np.bincount(counts.ravel())
+
+    rows, ancestors = _expand(labels, ancestry)
+    ids, _, npix = _sum_pairs(ancestors, np.zeros(len(ancestors), dtype=np.int64), counts[rows])
+
+    return ids, npix
+
+
+def overlap_matrix(index_map1, ancestry1, index_map2, ancestry2):
+    '''
+    Compute the number of pixels shared by each pair of structures from two
+    dendrograms defined on the same grid. The result is returned as a sparse
+    matrix in coordinate form (id1, id2, overlap), with only non-zero
+    entries. Branches include the pixels of all their sub-structures.
+    '''
+
+    if index_map1.shape != index_map2.shape:
+        raise Exception("index maps should have the same shape")
+
+    a = index_map1.ravel()
+    b = index_map2.ravel()
+    keep = (a > 0) & (b > 0)
+
+    # Overlap between the pixels directly assigned to each structure
+    id1, id2, overlap = _sum_pairs(a[keep], b[keep])
+
+    # Propagate the overlaps up the first tree, then up the second tree
+    rows, id1 = _expand(id1, ancestry1)
+    id2, overlap = id2[rows], overlap[rows]
+
+    rows, id2 = _expand(id2, ancestry2)
+    id1, overlap = id1[rows], overlap[rows]
+
+    return _sum_pairs(id1, id2, overlap)
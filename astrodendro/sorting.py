@@ -0,0 +1,133 @@
+import numpy as np
+
+
+def _key_dtype(span):
+    "Return the smallest unsigned type able to hold values up to span"
+    if span < 2 ** 8:
+        return np.uint8
+    elif span < 2 ** 16:
+        return np.uint16
+    else:
+        return None
+
+
+def _counting_argsort(key, counts):
+    '''
+    Stable counting sort of non-negative integer keys, where counts is
+    np.bincount(key). Each occupied level is filled in with its indices in
+    increasing order, so this is only efficient for a few levels.
+    '''
+    starts = np.cumsum(counts) - counts
+    order = np.empty(len(key), dtype=np.intp)
+    for level in np.nonzero(counts)[0]:
+        start = starts[level]
+        order[start:start + counts[level]] = np.nonzero(key == level)[0]
+    return order
+
+
+def _argsort_key(key, max_levels):
+    "Stable argsort of an unsigned 8- or 16-bit key"
+    counts = np.bincount(key)
+    occupied = counts > 0
+    if np.sum(occupied) <= max_levels:
+        # Remove unoccupied levels from the key
+        if not np.all(occupied):
+            key = (np.cumsum(occupied) - 1)[key]
+            counts = counts[occupied]
+        return _counting_argsort(key, counts)
+    else:
+        return np.argsort(key, kind='mergesort')
+
+
+def _quantized_key(values, sample_size=4096):
+    '''
+    If the floating-point values take evenly spaced levels (as for integer
+    or BSCALE-scaled data), return the key (vmax - value) / step as a small
+    unsigned integer array, otherwise return None.
+    '''
+
+    # Estimate the step from a sample, which quickly rejects continuous data
+    stride = max(1, values.size // sample_size)
+    sample = np.unique(values[::stride])
+    if len(sample) > 1:
+        step = np.min(np.diff(sample))
+        if not (sample[-1] - sample[0]) / step < 2 ** 16:
+            return None
+
+    vmin, vmax = values.min(), values.max()
+
+    if vmin == vmax:
+        return np.zeros(values.size, dtype=np.uint8)
+    elif len(sample) == 1:
+        step = vmax - vmin
+
+    n_steps = np.round((vmax - vmin) / step)
+    dtype = _key_dtype(n_steps)
+    if dtype is None:
+        return None
+
+    # Refine the step using the full range, to avoid accumulating errors
+    step = (float(vmax) - float(vmin)) / n_steps
+
+    key = np.subtract(vmax, values, dtype=np.float64)
+    key = np.round(key / step).astype(dtype)
+
+    # Rounding preserves the order, so the key is valid if each key value
+    # corresponds to a single data value
+    level_values = np.zeros(int(key.max()) + 1, dtype=values.dtype)
+    level_values[key] = values
+    if np.all(level_values[key] == values):
+        return key
+    else:
+        return None
+
+
+def argsort_descending(values, stable=False, max_levels=8):
+    '''
+    Return the indices that sort values in decreasing order.
+
+    Integer data, or floating-point data taking evenly spaced levels (such
+    as scaled BITPIX 16 data), spanning at most 65536 levels is converted to
+    a small unsigned key (vmax - value) / step, which directly gives the
+    decreasing order without a reversal. If at most max_levels distinct
+    levels are present, the key is ordered with a counting sort, and
+    otherwise with a stable sort of the 8- or 16-bit key (a radix sort for
+    numpy >= 1.17). In both cases, ties are broken by increasing index.
+
+    Other data is sorted with np.argsort, and ties are only broken by
+    increasing index if stable is True.
+    '''
+
+    values = np.asarray(values)
+
+    if values.size == 0:
+        return np.zeros(0, dtype=np.intp)
+
+    if values.dtype.kind == 'b':
+        values = values.astype(np.uint8)
+
+    key = None
+
+    if values.dtype.kind in 'iu':
+        vmin, vmax = values.min(), values.max()
+        dtype = _key_dtype(vmax - float(vmin))
+        if dtype is not None:
+            if values.dtype.kind == 'i':
+                key = int(vmax) - values.astype(np.int64)
+            else:
+                key = vmax - values
+            key = key.astype(dtype)
+    elif values.dtype.kind == 'f':
+        key = _quantized_key(values)
+
+    if key is not None:
+        return _argsort_key(key, max_levels)
+
+    if stable:
+        # A stable sort of the reversed array, reversed back, orders values
+        # by decreasing value and increasing index
+        n = values.size
+        order = np.argsort(values[::-1], kind='mergesort')
+        return n - 1 - order[::-1]
+    else:
+        return np.argsort(values)[::-1]
@@ -1,8 +1,21 @@
 import unittest
 import os
 
+import numpy as np
+
 import pyfits
 from astrodendro import Dendrogram
+from astrodendro.components import Trunk, Branch, Leaf
+
+
+def all_items(items):
+    found = []
+    for item in items:
+        found.append(item)
+        if type(item) == Branch:
+            found += all_items(item.items)
+    return found
+
 
 def test_compute():
     array = pyfits.getdata('data.fits.gz')
@@ -22,3 +35,137 @@ def test_read():
     d2.from_hdf5('test.hdf5')
     os.remove('test.hdf5')
 
+
+def test_argsort_descending():
+    from astrodendro.sorting import argsort_descending
+    for values in [np.array([3, 1, 3, 2, 1, 3], dtype=np.int16),
+                   np.array([3., 1., 3., 2., 1., 3.]),
+                   np.array([3, 1, 3, 2, 1, 3], dtype=np.float32) * 0.1 + 2.,
+                   np.array([0, 1000, 5, 1000, 0], dtype=np.uint16),
+                   np.arange(1000) % 200,
+                   (np.arange(1000) % 200) * 0.25 - 10.]:
+        order = argsort_descending(values)
+        expected = sorted(range(len(values)), key=lambda i: (-float(values[i]), i))
+        assert np.all(order == expected)
+    for values in [np.array([300000, 1, 300000, 2, 1, 300000]),
+                   np.array([3.5, 1., 3.5, 2., 1., 3.5, np.pi])]:
+        order = argsort_descending(values, stable=True)
+        expected = sorted(range(len(values)), key=lambda i: (-float(values[i]), i))
+        assert np.all(order == expected)
+
+def check_region(d, region):
+    d.to_hdf5('test.hdf5', chunks=(16,) * d.n_dim, compression='lzf')
+    d2 = Dendrogram()
+    d2.from_hdf5('test.hdf5', region=region)
+    os.remove('test.hdf5')
+    assert np.all(d2.data == d.data[region])
+    assert np.all(d2.index_map == d.index_map[region])
+    original = dict([(item.id, item) for item in all_items(d.trunk)])
+    # Expected structures are those with pixels in the region, and their
+    # ancestors
+    expected = set()
+    for idx in np.unique(d.index_map[region]):
+        item = original.get(idx)
+        while item is not None:
+            expected.add(item.id)
+            item = item.parent
+    items = all_items(d2.trunk)
+    assert set([item.id for item in items]) == expected
+    bounds = [(s.start, s.stop) for s in region]
+    if d.n_dim == 2:
+        bounds = [(0, 1)] + bounds
+    for item in items:
+        for values, (start, stop) in zip([item.z, item.y, item.x], bounds):
+            assert np.all((values >= start) & (values < stop))
+        if d.n_dim == 2:
+            assert np.all(d.index_map[item.y, item.x] == item.id)
+        else:
+            assert np.all(d.index_map[item.z, item.y, item.x] == item.id)
+        # Structures keep their original parent and flux range
+        if original[item.id].parent is None:
+            assert item.parent is None
+        else:
+            assert item.parent.id == original[item.id].parent.id
+        assert item.fmin == original[item.id].fmin
+        assert item.fmax == original[item.id].fmax
+        if type(item) == Branch:
+            ids = [sub_item.id for sub_item in item.items] + item.excluded_ids
+            assert sorted(ids) == sorted([sub_item.id for sub_item in original[item.id].items])
+    lines = []
+    for item in d2.trunk:
+        item.plot_dendrogram(None, 0., lines)
+    d2.to_newick()
+
+def test_read_region():
+    array = pyfits.getdata('data.fits.gz')
+    d = Dendrogram(array)
+    check_region(d, (slice(10, 40), slice(20, 50)))
+    check_region(d, (slice(30, 32), slice(30, 32)))
+
+def test_read_region_3d():
+    array = pyfits.getdata('data.fits.gz')
+    d = Dendrogram(np.array([array, array[::-1, :], array[:, ::-1]]))
+    check_region(d, (slice(1, 3), slice(10, 40), slice(20, 50)))
+
+def test_read_region_invalid():
+    array = pyfits.getdata('data.fits.gz')
+    d = Dendrogram(array)
+    for chunks in [(16,), (16, 16, 16)]:
+        try:
+            d.to_hdf5('test.hdf5', chunks=chunks)
+        except Exception, e:
+            assert 'chunks' in str(e)
+        else:
+            raise AssertionError("invalid chunks were accepted")
+    d.to_hdf5('test.hdf5')
+    for region in [(slice(0, 10),), (0, slice(0, 10))]:
+        try:
+            Dendrogram().from_hdf5('test.hdf5', region=region)
+        except Exception, e:
+            assert 'region' in str(e)
+        else:
+            raise AssertionError("invalid region was accepted")
+    os.remove('test.hdf5')
+
+def test_match():
+    array = pyfits.getdata('data.fits.gz')
+    d1 = Dendrogram(array)
+    d2 = Dendrogram(array, minimum_npix=10)
+    matches = d1.match(d1)
+    for idx in matches:
+        assert matches[idx] == (idx, 1.)
+    matches = d2.match(d1)
+    for leaf in d2.get_leaves():
+        assert matches[leaf.id][1] > 0.
+
+def build_dendrogram(index_map, branch_id):
+    # Build a dendrogram on a single row of pixels, where all the leaves
+    # are contained in one branch
+    d = Dendrogram()
+    d.index_map = index_map
+    leaves = []
+    branch = Branch(leaves, id=branch_id)
+    for x, idx in enumerate(index_map[0]):
+        if idx == branch_id:
+            branch.add_point(x, 0, 0, 1.)
+        elif idx > 0:
+            if idx not in [leaf.id for leaf in leaves]:
+                leaf = Leaf(id=idx)
+                leaf.parent = branch
+                leaves.append(leaf)
+            [leaf for leaf in leaves if leaf.id == idx][0].add_point(x, 0, 0, 2.)
+    d.trunk = Trunk()
+    d.trunk.append(branch)
+    return d
+
+def test_match_exact():
+    d1 = build_dendrogram(np.array([[1, 1, 3, 3, 2, 2, 0]]), 3)
+    d2 = build_dendrogram(np.array([[1, 1, 1, 3, 3, 3, 2]]), 3)
+    # Leaf 1 in d1 (pixels 0-1) best matches leaf 1 in d2 (pixels 0-2).
+    # Leaf 2 in d1 (pixels 4-5) only overlaps with d2 through branch 3,
+    # which covers pixels 0-6, and so does branch 3 in d1 (pixels 0-5).
+    matches = d1.match(d2)
+    assert matches == {1: (1, 2. / 3.), 2: (3, 2. / 7.), 3: (3, 6. / 7.)}
+    # Leaf 2 in d2 (pixel 6) does not overlap with d1
+    matches = d2.match(d1)
+    assert matches == {1: (1, 2. / 3.), 3: (3, 6. / 7.)}